@@ -1,10 +1,15 @@
 import json
 import logging
 import inspect
-from typing import Any, Callable, Coroutine, Dict, List, Optional,  Union
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Coroutine, Dict, List, Optional, Tuple,  Union
 from langchain.chains import LLMChain
 from langchain.prompts import  PromptTemplate
 from langchain.schema import LLMResult
+from langchain.schema.cache import BaseCache
+from langchain.load.dump import dumps
+from langchain.llms.base import BaseLanguageModel
 from langchain.callbacks.manager import CallbackManagerForChainRun, AsyncCallbackManagerForChainRun, Callbacks
 from langchain.tools.base import BaseTool
 from langchain.chat_models import ChatOpenAI
@@ -16,10 +21,10 @@ from langchain.prompts.chat import  ChatPromptValue
 from langchain.prompts.chat import  ChatPromptValue
 from langchain.schema import ChatGeneration, BaseMessage, HumanMessage, AIMessage
 from promptwatch import CachedChatLLM, register_prompt_template
-from .common import LlmSelector, print_log, LogColors, PromptTypeSettings, PromptTypes
+from .common import GlobalSettings, LlmSelector, print_log, LogColors, PromptTypeSettings, PromptTypes
 from .schema import OutputWithFunctionCall
 from .prompt_template import PromptDecoratorTemplate
-from .output_parsers import OpenAIFunctionsPydanticOutputParser, BaseOutputParser, OutputParserExceptionWithOriginal
+from .output_parsers import OpenAIFunctionsPydanticOutputParser, BaseOutputParser, OutputParserException, OutputParserExceptionWithOriginal
 from .function_decorator import get_function_schema
 
 import pydantic
@@ -37,6 +42,31 @@ except ImportError:
 
 MODELS_WITH_FUNCTIONS_SUPPORT=["gpt-3.5-turbo-0613","gpt-4-0613"]
 
+_SENTINEL=object()
+
+RETRY_PARSE_TEMPLATE = PromptTemplate.from_template("{original_prompt}This is our original response {original} but it's not in correct format, please convert it into following format:\n{format_instructions}\n\nIf the response doesn't seem to be relevant to the expected format instructions, return 'N/A'")
+register_prompt_template("retry_parse_template", RETRY_PARSE_TEMPLATE)
+
+_RETRY_CHAINS_CACHE_SIZE=8
+_retry_chains_cache:"OrderedDict[int, Tuple[BaseLanguageModel, LLMChain]]"=OrderedDict()
+_retry_chains_cache_lock = threading.Lock()
+
+def get_retry_parse_chain(llm:BaseLanguageModel)->LLMChain:
+    """ Get the (cached) chain used to re-format the output that failed to be parsed. 
+    LLMs are not hashable, so we key the cache by id... and keep the reference to the LLM in the cache, so the id can't be reused while it's cached (LLMChain holds only a copy of it)"""
+    key = id(llm)
+    with _retry_chains_cache_lock:
+        cached = _retry_chains_cache.get(key)
+        if cached is not None:
+            _retry_chains_cache.move_to_end(key)
+            return cached[1]
+    retry_chain = LLMChain(llm=llm, prompt=RETRY_PARSE_TEMPLATE)
+    with _retry_chains_cache_lock:
+        _retry_chains_cache[key] = (llm, retry_chain)
+        if len(_retry_chains_cache)>_RETRY_CHAINS_CACHE_SIZE:
+            _retry_chains_cache.popitem(last=False)
+    return retry_chain
+
 
 
 class FunctionsProvider:
@@ -47,6 +77,7 @@ class FunctionsProvider:
         self.aliases=[]
         self.function_schemas=[]
         self.func_name_map={}
+        self._is_async={} # id(function) -> is coroutine function... resolved once, when the function is added
         if not (isinstance(functions, dict) or isinstance(functions, list)):
             raise ValueError("FunctionsProvider must be initialized with list of functions or dictionary where key is the unique function name alias")
         
@@ -74,6 +105,7 @@ class FunctionsProvider:
             else:
                 raise Exception(f"Function {function} does not have function_name attribute. All functions must be marked with @llm_function decorator")
             self.function_schemas.append(lambda kwargs, f=function: get_function_schema(f, kwargs))
+            self._is_async[id(function)] = inspect.iscoroutinefunction(function)
         else:
             raise ValueError(f"Invalid item value in functions. Only Tools or functions decorated with @llm_function are allowed. Got: {function}")
         if f_name in self.func_name_map:
@@ -86,6 +118,13 @@ class FunctionsProvider:
     def __contains__(self, function):
         return function in self.functions
 
+    def is_async(self, function:Callable)->bool:
+        """ Whether the function is a coroutine function (precomputed for the functions added to this provider)"""
+        is_async = self._is_async.get(id(function))
+        if is_async is None:
+            is_async = inspect.iscoroutinefunction(function)
+        return is_async
+
     def get_function_schemas(self, inputs, _index:int=None):
         if self.function_schemas:
             _f_schemas = []
@@ -147,8 +186,11 @@ class LLMDecoratorChain(LLMChain):
     
     prompt_type:PromptTypeSettings = PromptTypes.UNDEFINED
     default_call_kwargs:Optional[Dict[str,Any]]
+    llm_cache:Optional[BaseCache]=None
+    """ Optional cache of LLM responses for this chain (used only for LLMs with temperature explicitly set to 0, and only for the responses that were parsed successfully) """
     _additional_instruction:Optional[str]=PrivateAttr()
     _is_retry:Optional[str]=PrivateAttr()
+    _pending_cache_update:Optional[Tuple[Tuple[str,str],list]]=PrivateAttr(default=None)
 
 
 
@@ -233,24 +275,23 @@ class LLMDecoratorChain(LLMChain):
 
     def execute(self,**kwargs):
         """Execute the chain and return outputs"""
-        print_log(log_object=f"> Entering {self.name} prompt decorator chain", log_level=self.prompt_type.log_level ,color=LogColors.WHITE_BOLD)
-        
-        
+        # entering/finished chain is logged by __call__
         result_data = self.__call__(**kwargs)
         
         result = result_data[self.output_key]
         try:
             result = self.postprocess_outputs(result_data, result)
-        except OutputParserExceptionWithOriginal as e:
-            if self.allow_retries:
-                retryChain, call_kwargs = self._get_retry_parse_call_args(self.prompt, e, lambda: self.prompt.format(kwargs["inputs"]))
+        except OutputParserException as e:
+            # any parser exception that carries the original output can be retried (i.e. OutputParserExceptionWithOriginal)
+            if self.allow_retries and getattr(e, "original", _SENTINEL) is not _SENTINEL:
+                retryChain, call_kwargs = self._get_retry_parse_call_args(self.prompt, e, lambda: self._format_original_prompt(kwargs))
                 result = retryChain.predict(**call_kwargs)
                 print_log(log_object=f"\nResult:\n{result}", log_level=self.prompt_type.log_level if not self.verbose else 100,color=self.prompt_type.color if self.prompt_type else LogColors.BLUE)
                 return self.postprocess_outputs(result_data, result)
             else: 
                 raise e
         
-        print_log(log_object=f"> Finished chain", log_level=self.prompt_type.log_level,color=LogColors.WHITE_BOLD)
+        self._update_llm_cache()
         return result
     
     async def aexecute(self,**kwargs):
@@ -272,31 +313,33 @@ class LLMDecoratorChain(LLMChain):
             result = result_data[self.output_key]
         
             result = self.postprocess_outputs(result_data, result)
-        except OutputParserExceptionWithOriginal as e:
-            if self.allow_retries:
-                retryChain, call_kwargs = self._get_retry_parse_call_args(self.prompt, e, lambda: self.prompt.format(kwargs["inputs"]))
+        except OutputParserException as e:
+            if self.allow_retries and getattr(e, "original", _SENTINEL) is not _SENTINEL:
+                retryChain, call_kwargs = self._get_retry_parse_call_args(self.prompt, e, lambda: self._format_original_prompt(kwargs))
                 result = await retryChain.apredict(**call_kwargs)
                 print_log(log_object=f"\nResult:\n{result}", log_level=self.prompt_type.log_level if not self.verbose else 100,color=self.prompt_type.color if self.prompt_type else LogColors.BLUE)
                 return self.postprocess_outputs(result_data, result)
             else: 
                 raise e
         
+        self._update_llm_cache()
         print_log(log_object=f"> Finished chain", log_level=self.prompt_type.log_level,color=LogColors.WHITE_BOLD)
         return result
     
+    def _format_original_prompt(self, call_kwargs:dict)->str:
+        inputs = call_kwargs.get("inputs") or (self.default_call_kwargs or {}).get("inputs") or {}
+        return self.prompt.format_prompt(**inputs).to_string()
+
     def _get_retry_parse_call_args(self,prompt_template:PromptDecoratorTemplate, exception:OutputParserExceptionWithOriginal, get_original_prompt:Callable):
         logging.warning(msg=f"Failed to parse output for {self.name}: {exception}\nRetrying...")
         if hasattr(self.prompt, "template_string") and self.format_instructions_parameter_key not in self.prompt.template_string:
             logging.warning(f"Please note that we didn't find a {self.format_instructions_parameter_key} parameter in the prompt string. If you don't include it in your prompt template, you need to provide your custom formatting instructions.")    
-        if exception.original_prompt_needed_on_retry:
+        if getattr(exception, "original_prompt_needed_on_retry", False):
             original_prompt=get_original_prompt()
         else:
             original_prompt=""
-        retry_parse_template = PromptTemplate.from_template("{original_prompt}This is our original response {original} but it's not in correct format, please convert it into following format:\n{format_instructions}\n\nIf the response doesn't seem to be relevant to the expected format instructions, return 'N/A'")
-        register_prompt_template("retry_parse_template", retry_parse_template)
-        
-        retryChain = LLMChain(llm=self.llm, prompt=retry_parse_template)
-        format_instructions = prompt_template.output_parser.get_format_instructions()
+        retryChain = get_retry_parse_chain(self.llm)
+        format_instructions = prompt_template.get_output_format_instructions()
         if not format_instructions:
             raise Exception(f"Failed to get format instructions for {self.name} from output parser {prompt_template.output_parser}.")
         call_kwargs = {"original_prompt":original_prompt, "original":exception.original, "format_instructions":format_instructions}
@@ -331,6 +374,49 @@ class LLMDecoratorChain(LLMChain):
             "llm_selector_rule_key":self.llm_selector_rule_key
             }
 
+    def _get_llm_cache_key(self, llm:BaseLanguageModel, prompts:list, stop:Optional[List[str]], **llm_kwargs)->Optional[Tuple[str,str]]:
+        """ Build the (prompt, llm_string) key for llm_cache, in the same format LangChain uses for its global cache. Returns None if the response should not be cached."""
+        if self.llm_cache is None or len(prompts)!=1 or getattr(self, "_additional_instruction", None):
+            return None
+        if getattr(llm, "temperature", None) != 0:
+            # unless the sampling is explicitly deterministic, caching would change the behavior
+            return None
+        if isinstance(llm, BaseChatModel):
+            return dumps(prompts[0].to_messages()), llm._get_llm_string(stop=stop, **llm_kwargs)
+        else:
+            params = {**llm.dict(), "stop":stop, **llm_kwargs}
+            return prompts[0].to_string(), str(sorted(params.items()))
+
+    def _update_llm_cache(self):
+        """ Store the last LLM response into llm_cache... to be called once the output was processed without errors"""
+        if self._pending_cache_update:
+            cache_key, generations = self._pending_cache_update
+            self._pending_cache_update = None
+            self.llm_cache.update(*cache_key, generations)
+
+    def _generate_with_cache(self, llm:BaseLanguageModel, prompts:list, stop:Optional[List[str]], generate:Callable[[],LLMResult], **llm_kwargs)->LLMResult:
+        self._pending_cache_update = None
+        cache_key = self._get_llm_cache_key(llm, prompts, stop, **llm_kwargs)
+        if cache_key:
+            cached_generations = self.llm_cache.lookup(*cache_key)
+            if isinstance(cached_generations, list):
+                return LLMResult(generations=[cached_generations])
+        result = generate()
+        # the response is stored only after the output is successfully parsed (see _update_llm_cache), so we don't cache invalid responses
+        self._pending_cache_update = (cache_key, result.generations[0]) if cache_key else None
+        return result
+
+    async def _agenerate_with_cache(self, llm:BaseLanguageModel, prompts:list, stop:Optional[List[str]], agenerate:Callable[[],Coroutine[Any,Any,LLMResult]], **llm_kwargs)->LLMResult:
+        self._pending_cache_update = None
+        cache_key = self._get_llm_cache_key(llm, prompts, stop, **llm_kwargs)
+        if cache_key:
+            cached_generations = self.llm_cache.lookup(*cache_key)
+            if isinstance(cached_generations, list):
+                return LLMResult(generations=[cached_generations])
+        result = await agenerate()
+        self._pending_cache_update = (cache_key, result.generations[0]) if cache_key else None
+        return result
+
     def generate(
         self,
         input_list: List[Dict[str, Any]],
@@ -340,16 +426,16 @@ class LLMDecoratorChain(LLMChain):
         prompts, stop = self.prep_prompts(input_list, run_manager=run_manager)
 
         llm = self.select_llm(prompts, input_list[0])
-        try:
+        def run():
             return llm.generate_prompt(
                 prompts, stop, callbacks=run_manager.get_child() if run_manager else None
             )
+        try:
+            return self._generate_with_cache(llm, prompts, stop, run)
         except RequestRetry as e:
             if not self._is_retry==True:
                 self._is_retry=True
-                return llm.generate_prompt(
-                    prompts, stop, callbacks=run_manager.get_child() if run_manager else None
-                )
+                return run()
             else:
                 raise Exception(e.feedback)
 
@@ -362,16 +448,16 @@ class LLMDecoratorChain(LLMChain):
         prompts, stop = await self.aprep_prompts(input_list, run_manager=run_manager)
         llm = self.select_llm(prompts, input_list[0])
         
-        try:
+        async def arun():
             return await llm.agenerate_prompt(
                 prompts, stop, callbacks=run_manager.get_child() if run_manager else None
             )
+        try:
+            return await self._agenerate_with_cache(llm, prompts, stop, arun)
         except RequestRetry as e:
             if not self._is_retry==True:
                 self._is_retry=True
-                return await llm.agenerate_prompt(
-                    prompts, stop, callbacks=run_manager.get_child() if run_manager else None
-                )
+                return await arun()
             else:
                 raise Exception(e.feedback)
 
@@ -503,8 +589,9 @@ class LLMDecoratorChainWithFunctionSupport(LLMDecoratorChain):
                 return chat_model.generate_prompt(
                     prompts, stop, callbacks=run_manager.get_child() if run_manager else None
                 )
+        cache_kwargs = {"functions":final_function_schemas, **additional_kwargs} if self.functions else {}
         try:
-            return run()
+            return self._generate_with_cache(chat_model, prompts, stop, run, **cache_kwargs)
         except RequestRetry as e:
             if not self._is_retry==True:
                 self._is_retry=True
@@ -538,8 +625,9 @@ class LLMDecoratorChainWithFunctionSupport(LLMDecoratorChain):
                     prompts, stop, callbacks=run_manager.get_child() if run_manager else None
                 )
         
+        cache_kwargs = {"functions":final_function_schemas, **additional_kwargs} if final_function_schemas else {}
         try:
-            return await arun(additional_instruction=self._additional_instruction)
+            return await self._agenerate_with_cache(chat_model, prompts, stop, lambda: arun(additional_instruction=self._additional_instruction), **cache_kwargs)
         except RequestRetry as e:
             if not self._is_retry==True:
                 self._is_retry=True
@@ -598,7 +686,8 @@ class LLMDecoratorChainWithFunctionSupport(LLMDecoratorChain):
         _function = result_data["function"]
         if result_data.get("function_call_info"):
             _tool_arguments = result_data["function_call_info"]["arguments"]
-            if isinstance(_function, BaseTool):
+            if hasattr(_function, "run") and hasattr(_function, "arun"):
+                # tool-like object (i.e. BaseTool)
                 # langchain hack >> "__arg1" as a single argument hack
                 _is_single_arg_hack="__arg1" in _tool_arguments and len(_tool_arguments)==1
                 tool_input= _tool_arguments["__arg1"] if _is_single_arg_hack else _tool_arguments
@@ -614,7 +703,7 @@ class LLMDecoratorChainWithFunctionSupport(LLMDecoratorChain):
             elif callable(_function):
                 # TODO: add support for verbose and callbacks
                 
-                is_async = inspect.iscoroutinefunction(_function)
+                is_async = self.functions.is_async(_function)
                 
                 if is_async:
                     _async_function = _function
@@ -807,7 +896,12 @@ def log_results(result_data, result, is_function_call=False, verbose=False, prom
     if verbose or prompt_type:
         if not prompt_type:
             prompt_type = PromptTypes.UNDEFINED
-        print_log(log_object=f"\nResult:\n{result}", log_level=prompt_type.log_level if not verbose else 100,color=prompt_type.color if prompt_type else LogColors.BLUE)
+        log_level = prompt_type.log_level if not verbose else 100
+        settings = GlobalSettings.get_current_settings()
+        if not (settings.verbose or settings.logging_level <= log_level):
+            # print_log would not print anything... don't bother formatting the results
+            return
+        print_log(log_object=f"\nResult:\n{result}", log_level=log_level,color=prompt_type.color if prompt_type else LogColors.BLUE)
         if is_function_call:
             function_call_info_str = json.dumps(result_data.get('function_call_info'),indent=4)
-            print_log(log_object=f"\nFunction call:\n{function_call_info_str}", log_level=prompt_type.log_level if not verbose else 100,color=prompt_type.color if prompt_type else LogColors.BLUE)
\ No newline at end of file
+            print_log(log_object=f"\nFunction call:\n{function_call_info_str}", log_level=log_level,color=prompt_type.color if prompt_type else LogColors.BLUE)
\ No newline at end of file
@@ -4,6 +4,7 @@ import inspect
 import json
 import logging
 import os
+from functools import lru_cache
 from textwrap import dedent
 from langchain.prompts import PromptTemplate
 import yaml
@@ -355,16 +356,20 @@ def get_func_return_type(func: callable, with_args:bool=False)->Union[Type, Tupl
         return return_type if not with_args else (return_type, None)
             
             
-def get_function_docs(func: callable)->Tuple:
-    if not func.__doc__:
-        return None
-    fist_line, rest = func.__doc__.split('\n', 1) if '\n' in func.__doc__ else (func.__doc__, "")
+@lru_cache(maxsize=256)
+def _clean_docs(docs:str)->str:
+    fist_line, rest = docs.split('\n', 1) if '\n' in docs else (docs, "")
     # we dedent the first line separately,because its common that it often starts right after """
     fist_line = fist_line.strip()
     if fist_line:
         fist_line+="\n"
-    docs = fist_line + dedent(rest)
-    return docs
+    return fist_line + dedent(rest)
+
+def get_function_docs(func: callable)->Optional[str]:
+    if not func.__doc__:
+        return None
+    # cached by the docstring itself, since the docs of dynamic functions are parsed on every call
+    return _clean_docs(func.__doc__)
     
 
             
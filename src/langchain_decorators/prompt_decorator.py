@@ -1,24 +1,92 @@
 
 import logging
 import inspect
+import threading
 
-from functools import wraps
-from typing import Any, Callable, Dict, List, Optional,  Union
+from collections import OrderedDict
+from functools import partial, update_wrapper, wraps
+from typing import Any, Callable, Dict, List, Optional, Tuple, Type,  Union
 
 
 from langchain.tools.base import BaseTool
 from langchain.schema import BaseOutputParser
 from langchain.llms.base import BaseLanguageModel
+from langchain.schema.cache import BaseCache
 
 
 from .chains import LLMDecoratorChainWithFunctionSupport, LLMDecoratorChain, RequestRetry
 from .common import *
 from .prompt_template import PromptDecoratorTemplate
 from .output_parsers import *
-from .streaming_context import StreamingContext
+from .streaming_context import StreamingContext, TokenStream
 from .function_decorator import is_dynamic_llm_func, get_dynamic_function_template_args
 
+_StreamingContextCallback = StreamingContext.StreamingContextCallback
+
+_WARNED:set=set()
+
+def _warn_once(key:tuple, message:str, log_level:int=logging.WARNING, color:LogColors=LogColors.YELLOW):
+    """ print the warning only the first time for the given key (i.e. (id(func), condition)), since these are mostly configuration issues that would be repeated on every call"""
+    if key not in _WARNED:
+        _WARNED.add(key)
+        print_log(message, log_level, color)
+
+class _BoundAsyncPrompt(partial):
+    # async prompt bound to an instance... works like a bound method (inspect still sees a coroutine function through the partial), 
+    # but unlike the bound method, it binds the instance to `astream` as well
+
+    @property
+    def __self__(self):
+        return self.args[0]
+
+    @property
+    def __func__(self):
+        return self.func
+
+    @property
+    def __name__(self):
+        return self.func.__name__
+
+    def astream(self, *args, **kwargs)->TokenStream:
+        return self.func.astream(*self.args, *args, **kwargs)
+
+    def __getattr__(self, name):
+        # forward the public attributes of the prompt function (i.e. build_chain) ... but not the dunders, since these would confuse inspect (i.e. __wrapped__)
+        if name.startswith("__"):
+            raise AttributeError(name)
+        return getattr(self.func, name)
+
+
+class _AsyncPromptMethod:
+    # descriptor for async prompts defined in a class body, so `obj.prompt.astream()` gets `obj` as the source of inputs
+
+    def __init__(self, func:Callable):
+        update_wrapper(self, func)
+        self.__func__ = func
+
+    def __get__(self, obj, objtype=None):
+        if obj is None:
+            return self.__func__
+        return _BoundAsyncPrompt(self.__func__, obj)
+
+    def __call__(self, *args, **kwargs):
+        return self.__func__(*args, **kwargs)
+
+
+def _callable_cache_key(function)->Any:
+    # bound methods (i.e. functions=[self.tool]) are new objects on every attribute access, 
+    # so they are keyed by the instance and the underlying function instead of their own id
+    _self = getattr(function, "__self__", None)
+    if _self is not None and hasattr(function, "__func__"):
+        return (id(_self), id(function.__func__))
+    return id(function)
+
+
+CHAINS_CACHE_SIZE=8 # max number of cached chain configurations per prompt function
+
 SPECIAL_KWARGS=["callbacks","followup_handle","llm_selector_rule_key","memory","functions","function_call","capture_stream","llm_selector_rule_key", "stop"]
+# control kwargs that are consumed by the decorator itself (not passed into the chain inputs)
+RESERVED_KWARGS=frozenset(["capture_stream","followup_handle","llm_selector_rule_key","callbacks","memory","functions"])
 
 def llm_prompt(
         prompt_type:PromptTypeSettings=PromptTypes.UNDEFINED, # do not change the order of this first parameter unless you will change also the fist few lines... since we are handling cases when decorator is used with and without arguments too, than this will be the func
@@ -37,7 +105,8 @@ def llm_prompt(
         llm_selector:Optional[LlmSelector]=None,
         functions_source:str=None,
         memory_source:str=None,
-        control_kwargs:List[str]=SPECIAL_KWARGS
+        control_kwargs:List[str]=SPECIAL_KWARGS,
+        cache:Optional[BaseCache]=None
         ):
     """
     Decorator for functions that turns a regular function into a LLM prompt executed with default model and settings.
@@ -88,6 +157,8 @@ def llm_prompt(
         `functions_source` - only for bound functions ... name of a field or property on `self` that should be used as a source of functions for the OpenAI functions. If not set, you still can pass in functions as an argument, which will also override this.
 
         `control_kwargs` - kwargs that only controls other the behavior, and shall not be passed as template arguments. These are: `callbacks`, `followup_handle`, `llm_selector_rule_key`, `memory`, `functions`, `function_call`, `capture_stream`, `llm_selector_rule_key`, `stop`
+
+        `cache` - langchain cache (i.e. `InMemoryCache`, `SQLiteCache`) to store the LLM responses of this prompt. The responses are cached only for LLMs with temperature explicitly set to 0, and only if the output was parsed successfully. The cache is bypassed when streaming or using a followup handle.
     """
     
 
@@ -123,46 +194,121 @@ def llm_prompt(
         else:
             _capture_stream = capture_stream
         if _capture_stream and not is_async:
-            print_log(f"Warning: capture_stream=True is only supported for async functions. Ignoring capture_stream for {full_name}", logging.WARNING, LogColors.YELLOW)
+            _warn_once((id(func),"capture_stream_sync"), f"Warning: capture_stream=True is only supported for async functions. Ignoring capture_stream for {full_name}")
             _capture_stream=False
-        
-        @wraps(func)
-        def build_chain(*args, **kwargs)->LLMDecoratorChain:
-            global_settings = GlobalSettings.get_current_settings()
-
-            capture_stream=_capture_stream
 
-            if "capture_stream" in kwargs:
-                if not isinstance(capture_stream,bool):
-                    raise ValueError("capture_stream is a reserved kwarg and must be of type bool")
-                capture_stream=kwargs["capture_stream"]
-                del kwargs["capture_stream"]
+        # these are decoration-time constants, so we resolve them once here instead of on every call
+        _prompt_type = prompt_type or PromptTypes.UNDEFINED
+        _explicit_llm = llm or (prompt_type and prompt_type.llm) or None
+        if _explicit_llm is None:
+            _llm_selector_override = llm_selector or (prompt_type and prompt_type.llm_selector) or None
+            explicit_llm_streaming_warning = None
+        else:
+            _llm_selector_override = None
+            if not hasattr(_explicit_llm,"streaming"):
+                explicit_llm_streaming_warning = f"Warning: capture_stream on {name} is on, but the provided LLM {_explicit_llm} doesn't seem to be supporting streaming."
+            elif not getattr(_explicit_llm, "streaming"):
+                explicit_llm_streaming_warning = f"Warning: capture_stream on {name} is on, but the provided LLM {_explicit_llm} doesn't have streaming on! Stream wont be captured"
+            else:
+                explicit_llm_streaming_warning = None
+            if _capture_stream and explicit_llm_streaming_warning:
+                # no need to wait for the first call, we already know this won't stream
+                _warn_once((id(func),"explicit_llm_streaming"), explicit_llm_streaming_warning)
+        
+        control_kwargs_set=frozenset(control_kwargs)
+        prompt_template:PromptDecoratorTemplate=None
+        is_functions_output_parser=False
+        output_parser_functions:list=None # the function for OpenAIFunctionsPydanticOutputParser... built once, so the chain can be cached
+        input_variables_set:frozenset=frozenset()
+        default_values_items:tuple=()
+
+        def get_prompt_template()->PromptDecoratorTemplate:
+            # the template depends only on the decorated function and decorator args, so we build it once (lazily, on the first call) and reuse it
+            nonlocal prompt_template, is_functions_output_parser, output_parser_functions, input_variables_set, default_values_items, kwargs_fast_path_enabled
+            if prompt_template is None:
+                _prompt_template = PromptDecoratorTemplate.from_func(func, 
+                                                                template_format=template_format, 
+                                                                output_parser=output_parser, 
+                                                                format_instructions_parameter_key=format_instructions_parameter_key,
+                                                                template_name=template_name,
+                                                                template_version=template_version,
+                                                                prompt_type=prompt_type
+                                                                )
+                reserved_inputs_violations=[key for key in _prompt_template.input_variables if key in control_kwargs_set]
+                if reserved_inputs_violations:
+                    raise Exception(f"Invalid prompt template: {reserved_inputs_violations} are reserved prompt arguments and cannot be used in prompt template.")
+                is_functions_output_parser = isinstance(_prompt_template.output_parser, OpenAIFunctionsPydanticOutputParser)
+                if is_functions_output_parser:
+                    output_parser_functions = [_prompt_template.output_parser.build_llm_function()]
+                input_variables_set = frozenset(_prompt_template.input_variables)
+                default_values_items = tuple(_prompt_template.default_values.items()) if _prompt_template.default_values else ()
+                if not RESERVED_KWARGS.isdisjoint(_prompt_template.default_values or ()):
+                    # reserved kwargs with default values in the signature (i.e. functions=[...]) have to be handled by the full path
+                    kwargs_fast_path_enabled = False
+                prompt_template = _prompt_template
+            return prompt_template
+
+        chains_cache:"OrderedDict[tuple, Tuple[tuple, LLMDecoratorChain]]"=OrderedDict()
+        chains_cache_lock = threading.Lock()
+
+        def get_chain(chain_class:Type[LLMDecoratorChain], prompt_llm, memory, _llm_selector, llm_selector_rule_key, capture_stream, functions=None)->LLMDecoratorChain:
+            # constructing (and validating) the chain is not cheap, and its configuration rarely changes between the calls,
+            # so we keep a validated prototype per configuration and return its shallow copy (the chain holds per-call state, i.e. default_call_kwargs)
+            # configuration is keyed by identity... the cache keeps the references, so the ids can't be reused while cached
+            chain_args = (prompt_llm, _llm_selector, llm_selector_rule_key, capture_stream, tuple(functions) if isinstance(functions,list) else functions)
+            key = (chain_class, *(tuple(map(_callable_cache_key,arg)) if isinstance(arg,tuple) else id(arg) for arg in chain_args))
+            with chains_cache_lock:
+                cached = chains_cache.get(key)
+                if cached is not None:
+                    chains_cache.move_to_end(key)
+            if cached is None:
+                chain_kwargs = {"functions":functions} if functions is not None else {}
+                prototype = chain_class(
+                    llm=prompt_llm, 
+                    name=name,
+                    prompt=get_prompt_template(),  
+                    llm_selector=_llm_selector, 
+                    llm_selector_rule_key=llm_selector_rule_key,
+                    capture_stream=capture_stream, 
+                    expected_gen_tokens=expected_gen_tokens, 
+                    format_instructions_parameter_key=format_instructions_parameter_key,
+                    prompt_type = _prompt_type,
+                    allow_retries=retry_on_output_parsing_error,
+                    # cached response would skip streaming of the tokens
+                    llm_cache=cache if not capture_stream else None,
+                    **chain_kwargs
+                    )
+                with chains_cache_lock:
+                    chains_cache[key] = (chain_args, prototype)
+                    if len(chains_cache)>CHAINS_CACHE_SIZE:
+                        chains_cache.popitem(last=False)
+            else:
+                prototype = cached[1]
+            # construct() instead of copy(), since copy() drops the fields marked as excluded (i.e. callbacks)
+            # llm and memory are passed in as they are, so the chain always works with the current state of these objects
+            return chain_class.construct(_fields_set=set(prototype.__fields_set__), **{**prototype.__dict__, "llm":prompt_llm, "memory":memory})
 
+        def resolve_capture_stream(capture_stream:bool)->bool:
             if capture_stream and not StreamingContext.get_context():
                 print_log(f"INFO: Not inside StreamingContext. Ignoring capture_stream for {full_name}", logging.DEBUG, LogColors.WHITE)
-                capture_stream=False
+                return False
+            return capture_stream
 
-            if "followup_handle" in kwargs:
-                followup_handle=kwargs["followup_handle"]
-                del kwargs["followup_handle"]
-            else:
-                followup_handle=None
-            
-            if not (llm or (prompt_type and prompt_type.llm)):
-                    if llm_selector:
-                        _llm_selector= llm_selector
-                    elif prompt_type and prompt_type.llm_selector:
-                        _llm_selector= prompt_type.llm_selector
-                    else:
-                        _llm_selector=  global_settings.llm_selector 
+        def resolve_llm(capture_stream:bool, kwargs:dict):
+            if _explicit_llm is None:
+                    # global settings are needed only if the LLM is not explicitly provided
+                    global_settings = GlobalSettings.get_current_settings()
+                    default_llm = global_settings.default_llm
+                    _llm_selector = _llm_selector_override or global_settings.llm_selector 
 
                     if capture_stream and not _llm_selector:
-                        if not global_settings.default_streaming_llm:
-                            print_log(f"Warning: capture_stream on {name} is on, but the default LLM {llm} doesn't seem to be supporting streaming.", logging.WARNING, LogColors.YELLOW)
+                        default_streaming_llm = global_settings.default_streaming_llm
+                        if not default_streaming_llm:
+                            _warn_once((id(func),"default_llm_streaming"), f"Warning: capture_stream on {name} is on, but the default LLM {default_llm} doesn't seem to be supporting streaming.")
                             
-                        prompt_llm=global_settings.default_streaming_llm or global_settings.default_llm
+                        prompt_llm=default_streaming_llm or default_llm
                     else:
-                        prompt_llm = global_settings.default_llm
+                        prompt_llm = default_llm
 
                     if "llm_selector_rule_key" in kwargs:
                         llm_selector_rule_key=kwargs["llm_selector_rule_key"]
@@ -171,38 +317,64 @@ def llm_prompt(
                         llm_selector_rule_key=_llm_selector_rule_key
                 
             else:
-                prompt_llm=llm or prompt_type.llm
+                prompt_llm=_explicit_llm
                 llm_selector_rule_key=None
                 _llm_selector=None # if LLM is explicitly provided, we don't use the selector
-                if capture_stream:
-                    if  hasattr(llm,"streaming"):
-                        if not getattr(llm, "streaming"):
-                            print_log(f"Warning: capture_stream on {name} is on, but the provided LLM {llm} doesn't have streaming on! Stream wont be captured", logging.WARNING, LogColors.YELLOW)
-                    else:
-                        print_log(f"Warning: capture_stream on {name} is on, but the provided LLM {llm} doesn't seem to be supporting streaming.", logging.WARNING, LogColors.YELLOW)
-                   
-                
+                if capture_stream and explicit_llm_streaming_warning:
+                    _warn_once((id(func),"explicit_llm_streaming"), explicit_llm_streaming_warning)
+            return prompt_llm, _llm_selector, llm_selector_rule_key
 
-            input_variables_source=None
-            if len(args)==1 and hasattr(args[0],"__dict__"):
-                # is a proper object
-                input_variables_source = args[0]
+        # without these, the inputs can't come from the bound object (self), so a call with only template inputs can take the fast path
+        kwargs_fast_path_enabled = not (memory_source or functions_source)
+
+        @wraps(func)
+        def build_chain(*args, **kwargs)->LLMDecoratorChain:
+            get_prompt_template() # builds the template (and the derived state used below) on the first call
+
+            if not args and kwargs_fast_path_enabled and RESERVED_KWARGS.isdisjoint(kwargs):
+                # fast path for the most common case... only template inputs are passed in
+                # (streaming is off for most of the prompts, no need to look for the StreamingContext then)
+                capture_stream = resolve_capture_stream(True) if _capture_stream else False
+                prompt_llm, _llm_selector, llm_selector_rule_key = resolve_llm(capture_stream, kwargs)
+                for key, value in default_values_items:
+                    kwargs.setdefault(key, value)
+                callbacks = [_StreamingContextCallback()] if capture_stream else []
+                if is_functions_output_parser:
+                    kwargs["function_call"] = output_parser_functions[0]
+                    llmChain = get_chain(LLMDecoratorChainWithFunctionSupport, prompt_llm, None, _llm_selector, llm_selector_rule_key, capture_stream, functions=output_parser_functions)
+                else:
+                    llmChain = get_chain(LLMDecoratorChain, prompt_llm, None, _llm_selector, llm_selector_rule_key, capture_stream)
+                return finalize_chain(llmChain, kwargs, None, None, set(), callbacks, None)
+
+            capture_stream=_capture_stream
 
-            elif len(args)>1:
-                raise Exception(f"Positional arguments are not supported for prompt functions. Only one positional argument as an object with attributes as a source of inputs is supported. Got: {args}")
+            if "capture_stream" in kwargs:
+                if not isinstance(kwargs["capture_stream"],bool):
+                    raise ValueError("capture_stream is a reserved kwarg and must be of type bool")
+                capture_stream=kwargs["capture_stream"]
+                del kwargs["capture_stream"]
+
+            capture_stream = resolve_capture_stream(capture_stream)
+
+            if "followup_handle" in kwargs:
+                followup_handle=kwargs["followup_handle"]
+                del kwargs["followup_handle"]
+            else:
+                followup_handle=None
+            
+            prompt_llm, _llm_selector, llm_selector_rule_key = resolve_llm(capture_stream, kwargs)
+
+            if args:
+                if len(args)>1:
+                    raise Exception(f"Positional arguments are not supported for prompt functions. Only one positional argument as an object with attributes as a source of inputs is supported. Got: {args}")
+                # only a proper object can be a source of inputs
+                input_variables_source = args[0] if hasattr(args[0],"__dict__") else None
+            else:
+                input_variables_source=None
             
             
-            prompt_template = PromptDecoratorTemplate.from_func(func, 
-                                                            template_format=template_format, 
-                                                            output_parser=output_parser, 
-                                                            format_instructions_parameter_key=format_instructions_parameter_key,
-                                                            template_name=template_name,
-                                                            template_version=template_version,
-                                                            prompt_type=prompt_type,
-                                                            original_kwargs=kwargs
-                                                            )
-            if prompt_template.default_values:
-                kwargs = {**prompt_template.default_values, **kwargs}
+            for key, value in default_values_items:
+                kwargs.setdefault(key, value)
 
             if "callbacks" in kwargs:
                 callbacks=kwargs.pop("callbacks")
@@ -210,7 +382,7 @@ def llm_prompt(
                 callbacks=[]
             
             if capture_stream:
-                callbacks.append(StreamingContext.StreamingContextCallback())
+                callbacks.append(_StreamingContextCallback())
             
 
             if "memory" in kwargs:
@@ -251,66 +423,27 @@ def llm_prompt(
                         func_args.update(optional)
                         kwargs = validate_and_enrich_kwargs(kwargs, input_variables_source,  memory,required, optional)
 
-                llmChain = LLMDecoratorChainWithFunctionSupport(
-                    llm=prompt_llm, 
-                    name=name,
-                    prompt=prompt_template, 
-                    memory=memory, 
-                    functions=functions, 
-                    llm_selector=_llm_selector, 
-                    llm_selector_rule_key=llm_selector_rule_key,
-                    capture_stream=capture_stream, 
-                    expected_gen_tokens=expected_gen_tokens, 
-                    format_instructions_parameter_key=format_instructions_parameter_key,
-                    prompt_type = prompt_type or PromptTypes.UNDEFINED,
-                    allow_retries=retry_on_output_parsing_error
-                    )
-
+                llmChain = get_chain(LLMDecoratorChainWithFunctionSupport, prompt_llm, memory, _llm_selector, llm_selector_rule_key, capture_stream, functions=functions)
 
-            elif isinstance(prompt_template.output_parser, OpenAIFunctionsPydanticOutputParser):
-                function=prompt_template.output_parser.build_llm_function()
-                kwargs["function_call"] = function
-                llmChain = LLMDecoratorChainWithFunctionSupport(
-                    llm=prompt_llm, 
-                    name=name,
-                    prompt=prompt_template,  
-                    memory=memory, 
-                    functions=[function], 
-                    llm_selector=_llm_selector, 
-                    llm_selector_rule_key=llm_selector_rule_key,
-                    capture_stream=capture_stream, 
-                    expected_gen_tokens=expected_gen_tokens, 
-                    format_instructions_parameter_key=format_instructions_parameter_key,
-                    prompt_type = prompt_type or PromptTypes.UNDEFINED,
-                    allow_retries=retry_on_output_parsing_error
-                    )
+            elif is_functions_output_parser:
+                kwargs["function_call"] = output_parser_functions[0]
+                llmChain = get_chain(LLMDecoratorChainWithFunctionSupport, prompt_llm, memory, _llm_selector, llm_selector_rule_key, capture_stream, functions=output_parser_functions)
             else:
-                llmChain = LLMDecoratorChain(
-                    llm=prompt_llm, 
-                    name=name,
-                    prompt=prompt_template,  
-                    memory=memory, 
-                    llm_selector=_llm_selector, 
-                    llm_selector_rule_key=llm_selector_rule_key,
-                    capture_stream=capture_stream, 
-                    expected_gen_tokens=expected_gen_tokens, 
-                    format_instructions_parameter_key=format_instructions_parameter_key,
-                    prompt_type = prompt_type or PromptTypes.UNDEFINED,
-                    allow_retries=retry_on_output_parsing_error
-                    )
-            
-            reserved_inputs_violations=[key for key in prompt_template.input_variables if key in control_kwargs]
-            if reserved_inputs_violations:
-                raise Exception(f"Invalid prompt template: {reserved_inputs_violations} are reserved prompt arguments and cannot be used in prompt template.")
+                llmChain = get_chain(LLMDecoratorChain, prompt_llm, memory, _llm_selector, llm_selector_rule_key, capture_stream)
             
-            unexpected_inputs = [key for key in kwargs if key not in prompt_template.input_variables and key not in control_kwargs and key not in func_args ]
+            return finalize_chain(llmChain, kwargs, input_variables_source, memory, func_args, callbacks, followup_handle)
+
+        def finalize_chain(llmChain:LLMDecoratorChain, kwargs:dict, input_variables_source, memory, func_args:set, callbacks:list, followup_handle)->LLMDecoratorChain:
+            unexpected_inputs = kwargs.keys() - input_variables_set - control_kwargs_set - func_args
             if unexpected_inputs:
                 raise TypeError(f"Unexpected inputs for prompt function {full_name}: {unexpected_inputs}. \nValid inputs are: {prompt_template.input_variables}\nHint: Make sure that you've used all the inputs in the template")
             
-            kwargs = validate_and_enrich_kwargs(kwargs, input_variables_source,  memory,prompt_template.input_variables)
+            kwargs = validate_and_enrich_kwargs(kwargs, input_variables_source,  memory,input_variables_set)
                 
                 
             if followup_handle:
+                # followup handle needs the LLM callbacks, which won't be triggered on cached response
+                llmChain.llm_cache=None
                 followup_handle.bind_to_chain(llmChain)
                 if callbacks:
                     callbacks.append(followup_handle)
@@ -325,52 +458,34 @@ def llm_prompt(
            
             return llmChain
 
-        def validate_and_enrich_kwargs(kwargs, input_variables_source, memory, required_args, optional_args=None):
-            missing_inputs = [ key for key in required_args if key not in kwargs ]
-            if optional_args:
-                missing_inputs.extend([key for key in optional_args if key not in kwargs ])
-            if format_instructions_parameter_key in missing_inputs:
-                missing_inputs.remove(format_instructions_parameter_key)
-                kwargs[format_instructions_parameter_key]=None #init the format instructions with None... will be filled later
-            if memory and memory.memory_key in missing_inputs:
-                missing_inputs.remove(memory.memory_key)
-            
-            def get_value_ext(source, key:str, default):
-                # this doesnśt work since native python Formatter doesn't support "." in keys
-                # if "." in key:
-                #     key, subpath = key.split(".",1)
-                # else:
-                subpath=None
-
-                if isinstance(source,dict):
-                    value = source.get(key, default)
-                else:
-                    value = getattr(source, key, default)
+        missing_value=object()
 
-                if subpath and value and value != default:
-                    return get_value_ext(value, subpath, default)
-                else:
-                    return value
-                
-            if missing_inputs:
-                missing_value={}
-                for key in missing_inputs:
-                    if input_variables_source:
-                        value= get_value_ext(input_variables_source, key,missing_value)
-                    else:
-                        value=missing_value
+        def get_missing_input(key:str, input_variables_source):
+            if key==format_instructions_parameter_key:
+                return None #init the format instructions with None... will be filled later
+            if not input_variables_source:
+                return missing_value
+            if isinstance(input_variables_source,dict):
+                return input_variables_source.get(key, missing_value)
+            return getattr(input_variables_source, key, missing_value)
 
-                    if value is missing_value:
-                        value= get_value_ext(kwargs, key,missing_value)
-                        if value is missing_value:
-                            if optional_args and key in optional_args:
-                                continue
-                            
-                            value= get_value_ext(kwargs, key,missing_value)
-                            value= get_value_ext(input_variables_source, key,missing_value)    
-                            raise TypeError(f"Missing a input for prompt function {full_name}: {key}.")
-                    
-                    kwargs[key] = value
+        def validate_and_enrich_kwargs(kwargs, input_variables_source, memory, required_args, optional_args=None):
+            # inputs are resolved lazily, only for the keys that are actually missing in kwargs (defaults are already applied)
+            memory_key = memory.memory_key if memory else None
+            for key in required_args:
+                if key in kwargs or key==memory_key:
+                    continue
+                value = get_missing_input(key, input_variables_source)
+                if value is missing_value:
+                    raise TypeError(f"Missing a input for prompt function {full_name}: {key}.")
+                kwargs[key] = value
+            if optional_args:
+                for key in optional_args:
+                    if key in kwargs or key==memory_key:
+                        continue
+                    value = get_missing_input(key, input_variables_source)
+                    if value is not missing_value:
+                        kwargs[key] = value
             return kwargs
         
         
@@ -395,7 +510,25 @@ def llm_prompt(
               
                 return await llmChain.aexecute()
             
+            def astream(*args, **kwargs)->TokenStream:
+                """ Execute the prompt with streaming on and iterate over the generated tokens as they arrive. 
+                The parsed result is available in `result` of the returned stream once the iteration is finished.
+                
+                Example:
+                    stream = my_prompt.astream(topic="...")
+                    async for token in stream:
+                        print(token, end="")
+                    result = stream.result
+                """
+                kwargs["capture_stream"]=True
+                return TokenStream(lambda: async_wrapper(*args, **kwargs))
+
             async_wrapper.build_chain=build_chain
+            async_wrapper.astream=astream
+            _qualname_parts = func.__qualname__.split(".")
+            if len(_qualname_parts)>1 and _qualname_parts[-2]!="<locals>":
+                # defined in a class body... we need a descriptor so that astream gets bound to the instance too
+                return _AsyncPromptMethod(async_wrapper)
             return async_wrapper
     if func:
         return decorator(func)
@@ -22,12 +22,14 @@ from .output_parsers import *
 
 import pydantic
 if pydantic.__version__ <"2.0.0":
-    from pydantic import BaseModel
+    from pydantic import BaseModel, PrivateAttr
 else:
-    from pydantic.v1 import BaseModel
+    from pydantic.v1 import BaseModel, PrivateAttr
 
 
 class BaseTemplateBuilder(ABC):
+    cache_templates:bool=False
+    """ Set to True if the built template depends only on template_parts (not on kwargs), so it can be built once and reused for all calls with the same template_parts"""
 
     @abstractmethod
     def build_template(self, template_parts:List[Tuple[str,str]],kwargs:Dict[str,Any])->PromptTemplate:
@@ -43,6 +45,13 @@ class BaseTemplateBuilder(ABC):
         pass
 
 class OpenAITemplateBuilder:
+    cache_templates:bool=True
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        # a subclass overriding build_template might use kwargs, so it has to opt in to the caching explicitly
+        if "build_template" in cls.__dict__ and "cache_templates" not in cls.__dict__:
+            cls.cache_templates = False
 
     def build_template(self, template_parts:List[Tuple[str,str]],kwargs:Dict[str,Any])->PromptTemplate:
         if len(template_parts)==1 and not template_parts[0][1]:
@@ -191,6 +200,8 @@ class PromptDecoratorTemplate(StringPromptTemplate):
     template_version:str=None
     prompt_type:PromptTypeSettings = None
     original_kwargs:dict=None
+    _cache:Dict[Any,Any]=PrivateAttr(default_factory=dict)
+    """ values derived from the (immutable) template... pydantic copies the template when passed into a chain, but the copies share this dict, so it has to be mutated, never reassigned"""
     
 
     
@@ -364,17 +375,36 @@ class PromptDecoratorTemplate(StringPromptTemplate):
             msg_template_final_str = self.prompt_template_drafts.finalize_template(kwargs)
             parts.append((msg_template_final_str,""))
         
-        template = prompt_type.prompt_template_builder.build_template(parts, kwargs)
+        template_builder = prompt_type.prompt_template_builder
+        if getattr(template_builder, "cache_templates", False):
+            # finalized parts differ only by which optional sections were rendered, so there is just a handful of variants to build
+            cache_key = ("final_template", tuple(parts))
+            template = self._cache.get(cache_key)
+            if template is None:
+                template = self._build_final_template(template_builder, parts, kwargs)
+                self._cache[cache_key] = template
+            return template
+        else:
+            return self._build_final_template(template_builder, parts, kwargs)
+
+    def _build_final_template(self, template_builder:BaseTemplateBuilder, parts:List[Tuple[str,str]], kwargs:Dict[str,Any])->PromptTemplate:
+        template = template_builder.build_template(parts, kwargs)
         template.output_parser = self.output_parser
             
             
         register_prompt_template(self.template_name, template, self.template_version)
         return template
 
+    def get_output_format_instructions(self)->Optional[str]:
+        """ Format instructions of the output parser. Parsers are not changed after the template is built, so we generate them only once (i.e. pydantic parser builds the whole schema description)"""
+        if "format_instructions" not in self._cache:
+            self._cache["format_instructions"] = self.output_parser.get_format_instructions() if self.output_parser else None
+        return self._cache["format_instructions"]
+
     def format_prompt(self, **kwargs: Any) -> PromptValue:
         if self.format_instructions_parameter_key in self.input_variables and  not kwargs.get(self.format_instructions_parameter_key)  and self.output_parser :
             # add format instructions to inputs
-            kwargs[self.format_instructions_parameter_key] = self.output_parser.get_format_instructions()
+            kwargs[self.format_instructions_parameter_key] = self.get_output_format_instructions()
             
         final_template = self.get_final_template(**kwargs)
         kwargs = {k:(v if v is not None else "" ) for k,v in  kwargs.items() if k in  final_template.input_variables}
@@ -1,6 +1,7 @@
+import asyncio
 import contextvars
 
-from typing import Any, Callable, Coroutine
+from typing import Any, AsyncIterator, Callable, Coroutine
 
 
 class StreamingContext():
@@ -48,3 +49,40 @@ class StreamingContext():
 
     def __exit__(self, exc_type, exc_value, traceback):
         self.context_var.set(None)
+
+
+
+class TokenStream:
+    """ Async iterator over the tokens generated by a prompt, yielded as soon as they arrive from the LLM. 
+    The final (parsed) result of the prompt is available in `result` once the iteration is finished."""
+
+    def __init__(self, run: Callable[[], Coroutine[Any, Any, Any]]) -> None:
+        self._run = run
+        self.result = None
+
+    def __aiter__(self) -> AsyncIterator[str]:
+        return self._iterate()
+
+    async def _iterate(self) -> AsyncIterator[str]:
+        queue = asyncio.Queue()
+        finished = object()
+
+        async def run_in_streaming_context():
+            # runs in its own task, so the StreamingContext is set only for this execution
+            try:
+                with StreamingContext(callback_async=queue.put):
+                    return await self._run()
+            finally:
+                queue.put_nowait(finished)
+
+        task = asyncio.ensure_future(run_in_streaming_context())
+        try:
+            while True:
+                token = await queue.get()
+                if token is finished:
+                    break
+                yield token
+            self.result = await task
+        finally:
+            if not task.done():
+                task.cancel()